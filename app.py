@@ -1,12 +1,21 @@
 import os
+import re
+import time
+import hashlib
+import logging
 import sqlite3
+import threading
+import json
+import httplib2
 import streamlit as st
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import google.generativeai as genai
+from google import genai as google_genai
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from PIL import Image
+from PIL import Image, ImageOps
 import io
 
 # Load environment variables
@@ -24,18 +33,276 @@ if not YOUTUBE_API_KEY:
     st.error("YouTube API key not found. Please add it to your .env file.")
     st.stop()
 
+logger = logging.getLogger(__name__)
+
 # Configure Gemini AI
 genai.configure(api_key=GEMINI_API_KEY)
 model = genai.GenerativeModel("gemini-1.5-flash")
 vision_model = genai.GenerativeModel("gemini-1.5-pro")
 
+# Batch jobs are billed at a discount but complete asynchronously
+BATCH_MODEL = "gemini-1.5-flash"
+BATCH_POLL_SECONDS = 30
+BATCH_MAX_POLL_SECONDS = 600
+BATCH_DONE_STATES = {
+    "JOB_STATE_SUCCEEDED",
+    "JOB_STATE_FAILED",
+    "JOB_STATE_CANCELLED",
+    "JOB_STATE_EXPIRED"
+}
+
+# Kept constant so sqlite3's statement cache reuses the parsed INSERT
+INSERT_SQL = '''
+    INSERT INTO saved_recipes
+    (recipe_name, recipe_name_telugu, region, meal_category,
+    cooking_style, ingredients, instructions, video_link,
+    cooking_time, created_date)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Static prompt text lives at module level; only the preferences are interpolated
+INGREDIENT_PROMPT = """
+Analyze this image and provide a detailed breakdown of Indian ingredients in the following format:
+
+1. Main Ingredients:
+   - List each visible main ingredient with quantity
+   - Specify condition (fresh, dried, processed)
+
+2. Spices and Seasonings:
+   - List visible spices with approximate quantities
+   - Note whole vs ground form
+
+3. Aromatics and Herbs:
+   - Identify fresh herbs, onions, garlic, ginger etc.
+   - Specify quantity and condition
+
+4. Additional Components:
+   - Any visible oils, ghee, or cooking mediums
+   - Special ingredients or regional specifics
+
+For each ingredient, provide:
+- Exact or estimated quantity
+- Condition/form
+- Any visible quality indicators
+- Common Indian name if applicable
+
+Format each category separately and be very precise with measurements.
+"""
+
+RECIPE_TEMPLATE = """
+Create a detailed {region} Indian {meal_category} recipe ({sub_category})
+based on these identified ingredients:
+
+{ingredients}
+
+Requirements:
+- Cooking Style: {cooking_style}
+- Maximum Time: {cooking_time} minutes
+- Spice Level: {spice_level}/5
+
+Format the response as:
+
+# [RECIPE NAME IN ENGLISH]
+# [RECIPE NAME IN TELUGU]
+
+## Ingredients
+[List all ingredients with precise measurements]
+
+## Preparation Steps (with time estimates)
+1. [Step-by-step instructions]
+
+## Cooking Method
+1. [Detailed cooking steps]
+
+## Tips & Variations
+- [Regional variations]
+- [Time-saving tips]
+- [Storage suggestions]
+
+## Serving Suggestions
+- [Accompaniments]
+- [Plating suggestions]
+
+Note: Focus on {cooking_style} style and ensure total cooking time stays within {cooking_time} minutes.
+"""
+
+# Several variants are requested in one call as structured JSON, so the
+# ingredients and instructions are only sent (and billed) once
+MAX_VARIANTS = 3
+JSON_CONFIG = {"response_mime_type": "application/json"}
+
+VARIANTS_TEMPLATE = """
+Create {variants} clearly distinct {region} Indian {meal_category} recipes ({sub_category})
+based on these identified ingredients:
+
+{ingredients}
+
+Requirements for every recipe:
+- Cooking Style: {cooking_style}
+- Maximum Time: {cooking_time} minutes
+- Spice Level: {spice_level}/5
+
+Return a JSON array of {variants} recipe objects with these keys:
+- "name_en": recipe name in English
+- "name_te": recipe name in Telugu
+- "ingredients": list of ingredients with precise measurements
+- "steps": list of preparation and cooking steps with time estimates
+- "tips": list of regional variations, time-saving tips and serving suggestions
+"""
+
+# Markdown heading lines; the first two carry the English and Telugu recipe names
+NAME_RE = re.compile(r'^\s*#+\s*(.+?)\s*$', re.M)
+
+# Longest edge sent to Gemini Vision; larger photos only add upload time and tokens
+MAX_IMAGE_EDGE = 1024
+
+def _prepare_image(uploaded_file):
+    """Decode an upload once and return it downscaled and re-encoded as JPEG bytes."""
+    uploaded_file.seek(0)
+    image = ImageOps.exif_transpose(Image.open(uploaded_file))
+    image.thumbnail((MAX_IMAGE_EDGE, MAX_IMAGE_EDGE), Image.LANCZOS)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=85, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+def _prompt_hash(prompt):
+    """Compact cache key for a Gemini prompt."""
+    return hashlib.blake2b(prompt.encode(), digest_size=16).digest()
+
+def _parse_variants(response_text):
+    """Parse a JSON variants reply into a non-empty list of recipe dicts; raises ValueError otherwise."""
+    variant_list = json.loads(response_text)
+    # JSON mode sometimes wraps the array in a single-key object such as {"recipes": [...]}
+    if isinstance(variant_list, dict) and len(variant_list) == 1:
+        variant_list = next(iter(variant_list.values()))
+    if not (isinstance(variant_list, list) and variant_list
+            and all(isinstance(v, dict) for v in variant_list)):
+        raise ValueError("Gemini did not return a list of recipes")
+    
+    # JSON mode doesn't enforce field types, so coerce names to strings and
+    # wrap scalar sections, which would otherwise render one bullet per character
+    def as_list(value):
+        if value is None:
+            return []
+        return [str(item) for item in value] if isinstance(value, list) else [str(value)]
+    
+    return [
+        {
+            'name_en': str(v.get('name_en') or ''),
+            'name_te': str(v.get('name_te') or ''),
+            'ingredients': as_list(v.get('ingredients')),
+            'steps': as_list(v.get('steps')),
+            'tips': as_list(v.get('tips'))
+        }
+        for v in variant_list
+    ]
+
+def _variant_markdown(variant):
+    """Render a JSON recipe variant in the same markdown layout as a single recipe."""
+    lines = [f"# {variant.get('name_en', '')}", f"# {variant.get('name_te', '')}", "", "## Ingredients"]
+    lines += [f"- {item}" for item in variant.get('ingredients', [])]
+    lines += ["", "## Cooking Method"]
+    lines += [f"{i}. {step}" for i, step in enumerate(variant.get('steps', []), 1)]
+    lines += ["", "## Tips & Variations"]
+    lines += [f"- {tip}" for tip in variant.get('tips', [])]
+    return "\n".join(lines)
+
+def _connect_db():
+    """Open the recipe database tuned for many small writes."""
+    conn = sqlite3.connect("indian_recipes.db")
+    # WAL keeps readers unblocked during writes, and with synchronous=NORMAL
+    # commits no longer wait on an fsync each
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=268435456")
+    return conn
+
+@st.cache_resource
+def _get_executor():
+    """Shared worker pool for API calls that can overlap with Gemini generation."""
+    return ThreadPoolExecutor(max_workers=4)
+
+@st.cache_resource
+def _get_batch_client():
+    """Client for the google-genai SDK, which exposes the Gemini Batch API."""
+    return google_genai.Client(api_key=GEMINI_API_KEY)
+
+# Search terms shared by every Telugu recipe video lookup
+VIDEO_QUERY_TEMPLATE = "{recipe_name} {region} {style} recipe telugu vantalu తెలుగు వంటలు"
+
+@st.cache_resource
+def _yt_client():
+    """YouTube Data API resource built once per process; execute() calls must pass their own Http."""
+    return build(
+        'youtube', 'v3',
+        developerKey=YOUTUBE_API_KEY,
+        static_discovery=True,
+        cache_discovery=False
+    )
+
+@st.cache_data(show_spinner=False, ttl=24 * 3600, max_entries=1024)
+def _yt_search(_youtube, query):
+    """Search YouTube for recipe videos, cached per query; errors raise and are not cached."""
+    request = _youtube.search().list(
+        part="snippet",
+        q=query,
+        type="video",
+        maxResults=3,
+        relevanceLanguage="te",
+        regionCode="IN",
+        videoDefinition="high"
+    )
+    # A fresh Http per call; the shared resource is used from several threads and sessions
+    response = request.execute(http=httplib2.Http())
+    
+    videos = []
+    if response['items']:
+        for item in response['items']:
+            video_id = item['id']['videoId']
+            title = item['snippet']['title']
+            videos.append({
+                'id': video_id,
+                'title': title,
+                'url': f"https://www.youtube.com/watch?v={video_id}"
+            })
+    return videos
+
+# Stored Gemini responses are reused for a week, then regenerated
+PROMPT_CACHE_TTL = 7 * 24 * 3600
+
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=256)
+def _load_response(_conn, prompt_hash):
+    """Look up a stored Gemini response younger than PROMPT_CACHE_TTL; misses raise KeyError so they are never cached."""
+    row = _conn.execute(
+        "SELECT response FROM prompt_cache WHERE hash = ? AND created > ?",
+        (prompt_hash, time.time() - PROMPT_CACHE_TTL)
+    ).fetchone()
+    if row is None:
+        raise KeyError(prompt_hash)
+    return row[0]
+
+@st.cache_data(show_spinner=False, ttl=7 * 24 * 3600)
+def _analyze_image(image_hash, _image_bytes):
+    """Run Gemini Vision on an image, cached per process on its SHA-256 hash."""
+    response = vision_model.generate_content([
+        INGREDIENT_PROMPT,
+        {"mime_type": "image/jpeg", "data": _image_bytes}
+    ])
+    return response.text.strip()
+
 class IndianRecipeSystem:
     def __init__(self):
         """Initialize the Indian recipe system with enhanced categorization."""
-        self.conn = sqlite3.connect("indian_recipes.db", check_same_thread=False)
+        # Each thread (script reruns, background searches, batch pollers)
+        # gets its own connection; the schema is created once up front
+        self._local = threading.local()
         self.create_recipes_table()
         
-        self.youtube = build('youtube', 'v3', developerKey=YOUTUBE_API_KEY)
+        self.youtube = _yt_client()
         
         # Enhanced categorization
         self.cuisine_regions = [
@@ -52,11 +319,13 @@ class IndianRecipeSystem:
         ]
         
         self.meal_categories = {
-            "Breakfast": ["Dosa", "Idli", "Upma", "Poha", "Paratha"],
-            "Lunch": ["Rice Based", "Roti Based", "Thali"],
-            "Dinner": ["Light Meals", "Full Course", "One Pot Meals"],
-            "Snacks": ["Tea Time", "Evening Snacks", "Quick Bites"]
+            "Breakfast": ("Dosa", "Idli", "Upma", "Poha", "Paratha"),
+            "Lunch": ("Rice Based", "Roti Based", "Thali"),
+            "Dinner": ("Light Meals", "Full Course", "One Pot Meals"),
+            "Snacks": ("Tea Time", "Evening Snacks", "Quick Bites")
         }
+        # Precomputed so the selectbox gets the same options object on every rerun
+        self._meal_keys = tuple(self.meal_categories)
         
         self.cooking_styles = [
             "Traditional",
@@ -67,6 +336,14 @@ class IndianRecipeSystem:
             "One Pot"
         ]
 
+    @property
+    def conn(self):
+        """SQLite connection for the calling thread, opened on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = _connect_db()
+        return conn
+
     def create_recipes_table(self):
         """Create enhanced database table for storing Indian recipes."""
         cursor = self.conn.cursor()
@@ -85,47 +362,74 @@ class IndianRecipeSystem:
                 created_date TEXT NOT NULL
             )
         ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS image_analyses (
+                sha256 BLOB PRIMARY KEY,
+                text TEXT NOT NULL,
+                created REAL NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS prompt_cache (
+                hash BLOB PRIMARY KEY,
+                response TEXT NOT NULL,
+                created REAL NOT NULL
+            )
+        ''')
         self.conn.commit()
 
-    def identify_ingredients_from_image(self, uploaded_file):
-        """Enhanced ingredient identification with detailed categorization."""
+    def save_recipe(self, row):
+        """Insert a single saved_recipes row."""
+        with self.conn:
+            self.conn.execute(INSERT_SQL, row)
+
+    def save_recipes_bulk(self, rows):
+        """Insert many saved_recipes rows in a single transaction."""
+        with self.conn:
+            self.conn.executemany(INSERT_SQL, rows)
+
+    def get_saved_analysis(self, image_hash):
+        """Return a previously stored ingredient analysis for a SHA-256 image digest."""
+        row = self.conn.execute(
+            "SELECT text FROM image_analyses WHERE sha256 = ?", (image_hash,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def save_analysis(self, image_hash, text):
+        """Persist an ingredient analysis so repeat uploads skip Gemini Vision."""
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO image_analyses (sha256, text, created) VALUES (?, ?, ?)",
+                (image_hash, text, time.time())
+            )
+
+    def get_cached_response(self, prompt_hash):
+        """Return a cached Gemini response for a prompt hash, or None."""
         try:
-            image = Image.open(uploaded_file)
-            
-            prompt = """
-            Analyze this image and provide a detailed breakdown of Indian ingredients in the following format:
+            return _load_response(self.conn, prompt_hash)
+        except KeyError:
+            return None
 
-            1. Main Ingredients:
-               - List each visible main ingredient with quantity
-               - Specify condition (fresh, dried, processed)
-            
-            2. Spices and Seasonings:
-               - List visible spices with approximate quantities
-               - Note whole vs ground form
-            
-            3. Aromatics and Herbs:
-               - Identify fresh herbs, onions, garlic, ginger etc.
-               - Specify quantity and condition
-            
-            4. Additional Components:
-               - Any visible oils, ghee, or cooking mediums
-               - Special ingredients or regional specifics
-            
-            For each ingredient, provide:
-            - Exact or estimated quantity
-            - Condition/form
-            - Any visible quality indicators
-            - Common Indian name if applicable
-            
-            Format each category separately and be very precise with measurements.
-            """
+    def save_response(self, prompt_hash, response):
+        """Persist a Gemini response under the hash of its prompt."""
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO prompt_cache (hash, response, created) VALUES (?, ?, ?)",
+                (prompt_hash, response, time.time())
+            )
+
+    def identify_ingredients_from_image(self, image_bytes):
+        """Enhanced ingredient identification with detailed categorization."""
+        try:
+            image_hash = hashlib.sha256(image_bytes).digest()
             
-            response = vision_model.generate_content([
-                prompt,
-                {"mime_type": "image/jpeg", "data": uploaded_file.getvalue()}
-            ])
+            saved = self.get_saved_analysis(image_hash)
+            if saved:
+                return saved
             
-            return response.text.strip()
+            analysis = _analyze_image(image_hash, image_bytes)
+            self.save_analysis(image_hash, analysis)
+            return analysis
         except Exception as e:
             st.error(f"Error identifying ingredients: {str(e)}")
             return None
@@ -133,35 +437,26 @@ class IndianRecipeSystem:
     def search_telugu_recipe_video(self, recipe_name, region, style):
         """Enhanced YouTube search for more relevant Telugu recipe videos."""
         try:
-            style_term = "traditional" if style == "Traditional" else style.lower()
-            search_query = f"{recipe_name} {region} {style_term} recipe telugu vantalu తెలుగు వంటలు"
-            
-            request = self.youtube.search().list(
-                part="snippet",
-                q=search_query,
-                type="video",
-                maxResults=3,
-                relevanceLanguage="te",
-                regionCode="IN",
-                videoDefinition="high"
-            )
-            response = request.execute()
-            
-            videos = []
-            if response['items']:
-                for item in response['items']:
-                    video_id = item['id']['videoId']
-                    title = item['snippet']['title']
-                    videos.append({
-                        'id': video_id,
-                        'title': title,
-                        'url': f"https://www.youtube.com/watch?v={video_id}"
-                    })
-            return videos
+            return self._search_videos(recipe_name, region, style)
+        except HttpError as e:
+            st.error(f"Error searching YouTube: {str(e)}")
+            return None
+
+    def _await_videos(self, future):
+        """Collect a background video search, reporting API errors in the UI."""
+        try:
+            return future.result()
         except HttpError as e:
             st.error(f"Error searching YouTube: {str(e)}")
             return None
 
+    def _search_videos(self, recipe_name, region, style):
+        """Query YouTube for Telugu recipe videos; API errors are raised to the caller."""
+        style_term = "traditional" if style == "Traditional" else style.lower()
+        search_query = VIDEO_QUERY_TEMPLATE.format(recipe_name=recipe_name, region=region, style=style_term)
+        
+        return _yt_search(self.youtube, search_query)
+
     def generate_recipe(self):
         """Streamlined recipe generation with all options visible at once."""
         st.title("🍲 Indian Recipe Generator")
@@ -173,25 +468,16 @@ class IndianRecipeSystem:
             st.session_state.analyzing_ingredients = False
         if 'preferences_set' not in st.session_state:
             st.session_state.preferences_set = False
+        if 'generated_recipe' not in st.session_state:
+            st.session_state.generated_recipe = None
+        if 'prepared_image' not in st.session_state:
+            st.session_state.prepared_image = None
 
         # Image Upload Section
         col1, col2 = st.columns([1, 1])
         
         with col1:
-            st.subheader("1. Upload Ingredients Photo")
-            uploaded_file = st.file_uploader("Choose an image...", type=["jpg", "jpeg", "png"])
-            
-            if uploaded_file:
-                st.image(uploaded_file, caption="Uploaded Ingredients", use_column_width=True)
-                
-                # Analyze ingredients button
-                if st.button("Analyze Ingredients") and not st.session_state.analyzing_ingredients:
-                    st.session_state.analyzing_ingredients = True
-                    with st.spinner("Analyzing ingredients... Please wait..."):
-                        identified_ingredients = self.identify_ingredients_from_image(uploaded_file)
-                        if identified_ingredients:
-                            st.session_state.identified_ingredients = identified_ingredients
-                    st.session_state.analyzing_ingredients = False
+            self._ingredients_panel()
 
         # Recipe Preferences Section (always visible)
         with col2:
@@ -200,7 +486,7 @@ class IndianRecipeSystem:
             # Create form for all preferences
             with st.form(key='recipe_preferences'):
                 region = st.selectbox("Select Region", self.cuisine_regions)
-                meal_category = st.selectbox("Meal Category", list(self.meal_categories.keys()))
+                meal_category = st.selectbox("Meal Category", self._meal_keys)
                 sub_category = st.selectbox(
                     "Sub Category",
                     self.meal_categories[meal_category]
@@ -208,11 +494,17 @@ class IndianRecipeSystem:
                 cooking_style = st.selectbox("Cooking Style", self.cooking_styles)
                 cooking_time = st.slider("Cooking Time (minutes)", 15, 120, 30, step=5)
                 spice_level = st.slider("Spice Level", 1, 5, 3)
+                variants = st.slider("Recipe Variants", 1, MAX_VARIANTS, 1)
+                batch_variants = st.checkbox(
+                    "Run as batch job (cheaper)",
+                    help="Runs through the Gemini Batch API; recipes are saved when the job finishes."
+                )
                 
                 # Submit button for preferences
                 preferences_submitted = st.form_submit_button("Set Preferences")
                 if preferences_submitted:
                     st.session_state.preferences_set = True
+                    st.session_state.generated_recipe = None
 
         # Display identified ingredients if available
         if st.session_state.identified_ingredients:
@@ -221,97 +513,288 @@ class IndianRecipeSystem:
 
         # Generate Recipe Button (enabled only when both ingredients and preferences are ready)
         if st.session_state.identified_ingredients and st.session_state.preferences_set:
-            if st.button("Generate Recipe", type="primary"):
-                prompt = f"""
-                Create a detailed {region} Indian {meal_category} recipe ({sub_category}) 
-                based on these identified ingredients:
-                
-                {st.session_state.identified_ingredients}
-                
-                Requirements:
-                - Cooking Style: {cooking_style}
-                - Maximum Time: {cooking_time} minutes
-                - Spice Level: {spice_level}/5
-                
-                Format the response as:
-                
-                # [RECIPE NAME IN ENGLISH]
-                # [RECIPE NAME IN TELUGU]
-                
-                ## Ingredients
-                [List all ingredients with precise measurements]
-                
-                ## Preparation Steps (with time estimates)
-                1. [Step-by-step instructions]
-                
-                ## Cooking Method
-                1. [Detailed cooking steps]
-                
-                ## Tips & Variations
-                - [Regional variations]
-                - [Time-saving tips]
-                - [Storage suggestions]
-                
-                ## Serving Suggestions
-                - [Accompaniments]
-                - [Plating suggestions]
-                
-                Note: Focus on {cooking_style} style and ensure total cooking time stays within {cooking_time} minutes.
-                """
-                
-                with st.spinner("Creating your personalized recipe..."):
-                    recipe_content = self.safe_generate_content(prompt)
-                    if recipe_content:
-                        st.markdown(recipe_content)
-                        
-                        # Extract recipe names
-                        recipe_lines = recipe_content.split('\n')[:2]
-                        recipe_name_en = recipe_lines[0].replace('#', '').strip()
-                        recipe_name_te = recipe_lines[1].replace('#', '').strip()
-                        
-                        # Find matching videos
-                        with st.spinner("Finding video tutorials..."):
-                            videos = self.search_telugu_recipe_video(recipe_name_en, region, cooking_style)
-                            
-                        if videos:
-                            st.subheader("వంటకం వీడియోలు / Recipe Videos")
-                            for video in videos:
-                                st.video(video['url'])
-                                st.caption(video['title'])
-                        
-                        if st.button("Save Recipe"):
-                            try:
-                                cursor = self.conn.cursor()
-                                cursor.execute('''
-                                    INSERT INTO saved_recipes 
-                                    (recipe_name, recipe_name_telugu, region, meal_category,
-                                    cooking_style, ingredients, instructions, video_link,
-                                    cooking_time, created_date)
-                                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                                ''', (
-                                    recipe_name_en, recipe_name_te, region, meal_category,
-                                    cooking_style, st.session_state.identified_ingredients,
-                                    recipe_content, videos[0]['url'] if videos else None,
-                                    cooking_time, datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                                ))
-                                self.conn.commit()
-                                st.success("Recipe saved successfully!")
-                                st.balloons()
-                            except Exception as e:
-                                st.error(f"Error saving recipe: {e}")
+            self._recipe_panel(
+                region, meal_category, sub_category, cooking_style,
+                cooking_time, spice_level, variants, batch_variants
+            )
         elif not st.session_state.identified_ingredients:
             st.info("Please upload and analyze your ingredients first.")
         elif not st.session_state.preferences_set:
             st.info("Please set your recipe preferences.")
 
+    @st.fragment
+    def _ingredients_panel(self):
+        """Photo upload and analysis; widget clicks here rerun only this fragment."""
+        st.subheader("1. Upload Ingredients Photo")
+        uploaded_file = st.file_uploader("Choose an image...", type=["jpg", "jpeg", "png"])
+        
+        if uploaded_file:
+            # Resize once per upload; later reruns reuse the encoded JPEG
+            prepared = st.session_state.prepared_image
+            if prepared and prepared[0] == uploaded_file.file_id:
+                image_bytes = prepared[1]
+            else:
+                try:
+                    image_bytes = _prepare_image(uploaded_file)
+                except Exception as e:
+                    st.error(f"Error reading image: {str(e)}")
+                    return
+                st.session_state.prepared_image = (uploaded_file.file_id, image_bytes)
+            st.image(image_bytes, caption="Uploaded Ingredients", use_container_width=True)
+            
+            # Analyze ingredients button
+            if st.button("Analyze Ingredients") and not st.session_state.analyzing_ingredients:
+                st.session_state.analyzing_ingredients = True
+                with st.spinner("Analyzing ingredients... Please wait..."):
+                    identified_ingredients = self.identify_ingredients_from_image(image_bytes)
+                    if identified_ingredients:
+                        st.session_state.identified_ingredients = identified_ingredients
+                st.session_state.analyzing_ingredients = False
+                
+                # A new analysis changes the rest of the page, so rerun it all
+                if identified_ingredients:
+                    st.session_state.generated_recipe = None
+                    st.rerun()
+
+    @st.fragment
+    def _recipe_panel(self, region, meal_category, sub_category, cooking_style,
+                      cooking_time, spice_level, variants, batch_variants):
+        """Recipe generation, videos and saving; widget clicks here rerun only this fragment."""
+        if st.button("Generate Recipe", type="primary"):
+            # Drop the previous recipe so a batch run or failed generation can't resurface it
+            st.session_state.generated_recipe = None
+            preferences = {
+                'region': region,
+                'meal_category': meal_category,
+                'sub_category': sub_category,
+                'ingredients': st.session_state.identified_ingredients,
+                'cooking_style': cooking_style,
+                'cooking_time': cooking_time,
+                'spice_level': spice_level
+            }
+            recipe_details = {
+                'region': region,
+                'meal_category': meal_category,
+                'cooking_style': cooking_style,
+                'ingredients': st.session_state.identified_ingredients,
+                'cooking_time': cooking_time
+            }
+            
+            if batch_variants:
+                prompt = VARIANTS_TEMPLATE.format(variants=variants, **preferences)
+                self.generate_batch_variants(prompt, recipe_details)
+                return
+            
+            # The video search only needs the preferences, so start it
+            # now and let it run while Gemini writes the recipe
+            future_videos = _get_executor().submit(
+                self._search_videos, sub_category, region, cooking_style
+            )
+            
+            if variants > 1:
+                prompt = VARIANTS_TEMPLATE.format(variants=variants, **preferences)
+                future_variants = _get_executor().submit(self.generate_variants, prompt)
+                with st.spinner("Creating your personalized recipes..."):
+                    try:
+                        variant_list = future_variants.result()
+                    except Exception as e:
+                        st.error(f"Error generating content: {e}")
+                        return
+                recipes = [
+                    (v.get('name_en', ''), v.get('name_te', ''), _variant_markdown(v))
+                    for v in variant_list
+                ]
+                self._show_recipes(recipes)
+            else:
+                # Stream the recipe so it renders as soon as the first tokens arrive
+                prompt = RECIPE_TEMPLATE.format(**preferences)
+                try:
+                    recipe_content = st.write_stream(self.safe_generate_content(prompt))
+                except Exception:
+                    # Already reported; don't keep, search for or save a truncated recipe
+                    return
+                if not recipe_content:
+                    return
+                
+                # Extract recipe names, tolerating replies with fewer than two headings
+                names = NAME_RE.findall(recipe_content)
+                recipe_name_en, recipe_name_te = (names + ["", ""])[:2]
+                recipes = [(recipe_name_en, recipe_name_te, recipe_content)]
+            
+            # Keep the sub-category results only when the recipe name contains the
+            # sub-category (e.g. "Masala Dosa" for "Dosa"); otherwise search by name
+            recipe_name_en = recipes[0][0]
+            with st.spinner("Finding video tutorials..."):
+                if recipe_name_en and sub_category.lower() not in recipe_name_en.lower():
+                    videos = self.search_telugu_recipe_video(recipe_name_en, region, cooking_style)
+                else:
+                    videos = self._await_videos(future_videos)
+            
+            # Keep the recipes so the Save button still has them after the fragment reruns
+            st.session_state.generated_recipe = {
+                'recipes': recipes,
+                'details': recipe_details,
+                'videos': videos
+            }
+        elif st.session_state.generated_recipe:
+            self._show_recipes(st.session_state.generated_recipe['recipes'])
+        
+        generated = st.session_state.generated_recipe
+        if not generated:
+            return
+        
+        videos = generated['videos']
+        if videos:
+            st.subheader("వంటకం వీడియోలు / Recipe Videos")
+            for video in videos:
+                st.video(video['url'])
+                st.caption(video['title'])
+        
+        if st.button("Save Recipe"):
+            try:
+                rows = self._recipe_rows(
+                    generated['recipes'], generated['details'],
+                    videos[0]['url'] if videos else None
+                )
+                if len(rows) == 1:
+                    self.save_recipe(rows[0])
+                else:
+                    self.save_recipes_bulk(rows)
+                st.success("Recipe saved successfully!")
+                st.balloons()
+            except Exception as e:
+                st.error(f"Error saving recipe: {e}")
+
+    def _show_recipes(self, recipes):
+        """Render one recipe inline, or several variants as tabs."""
+        if len(recipes) == 1:
+            st.markdown(recipes[0][2])
+            return
+        tabs = st.tabs([name_en or f"Variant {i}" for i, (name_en, _, _) in enumerate(recipes, 1)])
+        for tab, (_, _, content) in zip(tabs, recipes):
+            with tab:
+                st.markdown(content)
+
+    def _recipe_rows(self, recipes, recipe_details, video_link=None):
+        """Build saved_recipes rows for (English name, Telugu name, content) recipes."""
+        created_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return [
+            (
+                recipe_name_en, recipe_name_te, recipe_details['region'],
+                recipe_details['meal_category'], recipe_details['cooking_style'],
+                recipe_details['ingredients'], recipe_content, video_link,
+                recipe_details['cooking_time'], created_date
+            )
+            for recipe_name_en, recipe_name_te, recipe_content in recipes
+        ]
+
+    def generate_batch_variants(self, prompt, recipe_details):
+        """Queue recipe variants on the Gemini Batch API and save them in the background."""
+        try:
+            client = _get_batch_client()
+            job_name = self.submit_batch(client, [prompt])
+        except Exception as e:
+            st.error(f"Error submitting batch job: {e}")
+            return
+        
+        threading.Thread(
+            target=self._poll_batch,
+            args=(client, job_name, recipe_details),
+            daemon=True
+        ).start()
+        st.info(f"Batch job {job_name} submitted. The recipes will be saved when it completes.")
+
+    def submit_batch(self, client, prompts):
+        """Submit prompts as inline JSON requests to the Gemini Batch API and return the job name."""
+        job = client.batches.create(
+            model=BATCH_MODEL,
+            src=[
+                {"contents": [{"parts": [{"text": p}], "role": "user"}], "config": JSON_CONFIG}
+                for p in prompts
+            ],
+            config={"display_name": "recipe-variants"}
+        )
+        return job.name
+
+    def _poll_batch(self, client, job_name, recipe_details):
+        """Wait for a batch job to finish and store each generated recipe."""
+        delay = BATCH_POLL_SECONDS
+        while True:
+            try:
+                job = client.batches.get(name=job_name)
+            except Exception:
+                # Jobs can run for hours; a failed poll must not abandon a billed job
+                logger.warning("Error polling batch job %s, retrying in %ss", job_name, delay, exc_info=True)
+                time.sleep(delay)
+                delay = min(delay * 2, BATCH_MAX_POLL_SECONDS)
+                continue
+            if job.state.name in BATCH_DONE_STATES:
+                break
+            delay = BATCH_POLL_SECONDS
+            time.sleep(delay)
+        
+        if job.state.name != "JOB_STATE_SUCCEEDED":
+            logger.warning("Batch job %s ended in state %s", job_name, job.state.name)
+            return
+        
+        try:
+            recipes = []
+            for inline in job.dest.inlined_responses:
+                if inline.error:
+                    logger.warning("Skipping failed request in batch job %s: %s", job_name, inline.error)
+                    continue
+                if not inline.response or not inline.response.text:
+                    logger.warning("Skipping empty reply in batch job %s", job_name)
+                    continue
+                try:
+                    variant_list = _parse_variants(inline.response.text)
+                except ValueError:
+                    logger.warning("Skipping malformed reply in batch job %s", job_name)
+                    continue
+                recipes += [
+                    (v.get('name_en', ''), v.get('name_te', ''), _variant_markdown(v))
+                    for v in variant_list
+                ]
+            self.save_recipes_bulk(self._recipe_rows(recipes, recipe_details))
+        except Exception:
+            logger.exception("Error saving results of batch job %s", job_name)
+
+    def generate_variants(self, prompt):
+        """Generate several recipe variants in one JSON-mode Gemini call; errors are raised to the caller."""
+        prompt_hash = _prompt_hash(prompt)
+        cached = self.get_cached_response(prompt_hash)
+        if cached is not None:
+            return _parse_variants(cached)
+        
+        response = model.generate_content(prompt, generation_config=JSON_CONFIG)
+        variant_list = _parse_variants(response.text)
+        # Only cache replies with a valid shape, so a malformed one is retried
+        self.save_response(prompt_hash, response.text)
+        return variant_list
+
     def safe_generate_content(self, prompt):
-        """Safely generate content using Gemini AI with error handling."""
+        """Stream content from Gemini AI, replaying cached responses; errors are shown, then re-raised."""
+        prompt_hash = _prompt_hash(prompt)
+        cached = self.get_cached_response(prompt_hash)
+        if cached is not None:
+            yield cached
+            return
+        
+        chunks = []
         try:
-            response = model.generate_content(prompt)
-            return response.text
+            response = model.generate_content(prompt, stream=True)
+            for chunk in response:
+                chunks.append(chunk.text)
+                yield chunk.text
         except Exception as e:
             st.error(f"Error generating content: {e}")
-            return None
+            raise
+        self.save_response(prompt_hash, "".join(chunks))
+
+@st.cache_resource
+def get_system():
+    """Build the recipe system once per process instead of on every rerun."""
+    return IndianRecipeSystem()
 
 def main():
     """Enhanced main application with better UI organization."""
@@ -322,8 +805,7 @@ def main():
         initial_sidebar_state="expanded"
     )
 
-    system = IndianRecipeSystem()
-    system.generate_recipe()
+    get_system().generate_recipe()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file